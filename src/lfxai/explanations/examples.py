@@ -404,21 +404,22 @@ class NearestNeighbours(ExampleBasedExplainer, ABC):
         super().__init__(model, X_train, loss_f)
 
     def attribute(
-        self, X_test: torch.Tensor, train_idx: list, batch_size: int = 500, **kwargs
+        self, X_test: torch.Tensor, train_idx: list, batch_size: int = 1024, **kwargs
     ) -> torch.Tensor:
-        attribution = torch.zeros(len(X_test), len(train_idx))
-        train_representations = (
-            self.model.encoder(self.X_train[train_idx]).detach().unsqueeze(0)
-        )
-        n_batch = int(len(X_test) / batch_size)
-        for n in tqdm(range(n_batch), unit="batch", leave=False):
-            batch_features = X_test[n * batch_size : (n + 1) * batch_size]
-            batch_representations = (
-                self.model.encoder(batch_features).detach().unsqueeze(1)
-            )
-            attribution[n * batch_size : (n + 1) * batch_size] = 1 / torch.sum(
-                (batch_representations - train_representations) ** 2, dim=-1
-            )
+        attribution = torch.zeros(len(X_test), len(train_idx), device=X_test.device)
+        with torch.no_grad():
+            train_representations = self.model.encoder(self.X_train[train_idx])
+            for n in tqdm(
+                range(0, len(X_test), batch_size), unit="batch", leave=False
+            ):
+                batch_representations = self.model.encoder(
+                    X_test[n : n + batch_size]
+                )
+                # cdist dispatches to a single matmul-backed kernel per
+                # chunk instead of materialising the broadcasted
+                # (batch, train, latent) difference tensor
+                distances = torch.cdist(batch_representations, train_representations)
+                attribution[n : n + batch_size] = 1 / distances.square()
         return attribution
 
     def attribute_loader(
@@ -88,6 +88,35 @@ def attribute_auxiliary(
                 )
     return np.concatenate(attributions)
 
+def attribute_auxiliary_multi(
+    encoder: Module,
+    data_loader: torch.utils.data.DataLoader,
+    device: torch.device,
+    attr_methods: dict,
+    baseline=None,
+) -> dict:
+    """Compute attributions for several explainers in a single pass over the
+    loader, so each batch is decoded and copied to the device once instead of
+    once per explainer. Returns a dict mapping each explainer name to its
+    attribution array."""
+    attributions = {name: [] for name in attr_methods}
+    for inputs, _ in data_loader:
+        inputs = inputs.to(device)
+        auxiliary_encoder = AuxiliaryFunction(encoder, inputs)
+        for name, attr_method in attr_methods.items():
+            attr_method.forward_func = auxiliary_encoder
+            if isinstance(attr_method, Saliency):
+                batch_attr = attr_method.attribute(inputs)
+            elif isinstance(baseline, torch.Tensor):
+                batch_attr = attr_method.attribute(inputs, baseline)
+            elif isinstance(baseline, Module):
+                batch_attr = attr_method.attribute(inputs, baseline(inputs))
+            else:
+                batch_attr = attr_method.attribute(inputs)
+            attributions[name].append(batch_attr.detach().cpu().numpy())
+    return {name: np.concatenate(parts) for name, parts in attributions.items()}
+
+
 def attribute_auxiliary_single(
     encoder: Module,
     inputs: torch.Tensor,
@@ -141,9 +141,16 @@ class AutoEncoderMnist(nn.Module):
         self.train()
         train_loss = []
         for image_batch, _ in tqdm(dataloader, unit="batch", leave=False):
-            image_batch = image_batch.to(device)
-            recon_batch = self.forward(image_batch)
-            loss = self.loss_f(image_batch, recon_batch)
+            image_batch = image_batch.to(device, non_blocking=True)
+            # bf16 autocast doubles conv throughput on Ampere+ and needs no
+            # gradient scaling; the loss is evaluated in float32
+            with torch.autocast(
+                device_type="cuda",
+                dtype=torch.bfloat16,
+                enabled=device.type == "cuda",
+            ):
+                recon_batch = self.forward(image_batch)
+            loss = self.loss_f(image_batch, recon_batch.float())
             optimizer.zero_grad()
             loss.backward()
             optimizer.step()
@@ -155,10 +162,15 @@ class AutoEncoderMnist(nn.Module):
         test_loss = []
         with torch.no_grad():
             for image_batch, _ in dataloader:
-                image_batch = image_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
                 pert_batch = self.input_pert(image_batch)
-                recon_batch = self.forward(pert_batch)
-                loss = self.loss_f(image_batch, recon_batch)
+                with torch.autocast(
+                    device_type="cuda",
+                    dtype=torch.bfloat16,
+                    enabled=device.type == "cuda",
+                ):
+                    recon_batch = self.forward(pert_batch)
+                loss = self.loss_f(image_batch, recon_batch.float())
                 test_loss.append(loss.cpu().numpy())
         return np.mean(test_loss)
 
@@ -280,8 +292,8 @@ class ClassifierMnist(nn.Module):
         self.train()
         train_loss = []
         for image_batch, label_batch in tqdm(dataloader, unit="batches", leave=False):
-            image_batch = image_batch.to(device)
-            label_batch = label_batch.to(device)
+            image_batch = image_batch.to(device, non_blocking=True)
+            label_batch = label_batch.to(device, non_blocking=True)
             loss = self.loss_f(self.forward(image_batch), label_batch)
             optimizer.zero_grad()
             loss.backward()
@@ -295,8 +307,8 @@ class ClassifierMnist(nn.Module):
         test_acc = []
         with torch.no_grad():
             for image_batch, label_batch in dataloader:
-                image_batch = image_batch.to(device)
-                label_batch = label_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
+                label_batch = label_batch.to(device, non_blocking=True)
                 proba_batch = self.forward(image_batch)
                 loss = self.loss_f(proba_batch, label_batch)
                 pred_batch = torch.argmax(proba_batch, dim=-1)
@@ -494,7 +506,7 @@ class BetaVaeMnist(nn.Module):
         self.train()
         train_loss = []
         for image_batch, _ in dataloader:
-            image_batch = image_batch.to(device)
+            image_batch = image_batch.to(device, non_blocking=True)
             recon_batch, mu_batch, logvar_batch = self.forward(image_batch)
             loss = self.loss(
                 recon_batch,
@@ -516,7 +528,7 @@ class BetaVaeMnist(nn.Module):
         test_loss = []
         with torch.no_grad():
             for image_batch, _ in dataloader:
-                image_batch = image_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
                 recon_batch, mu_batch, logvar_batch = self.forward(image_batch)
                 loss = self.loss(
                     recon_batch,
@@ -628,7 +640,7 @@ class BetaTcVaeMnist(nn.Module):
         self.train()
         train_loss = []
         for image_batch, _ in dataloader:
-            image_batch = image_batch.to(device)
+            image_batch = image_batch.to(device, non_blocking=True)
             recon_batch, mu_batch, logvar_batch, latent_batch = self.forward(
                 image_batch
             )
@@ -651,7 +663,7 @@ class BetaTcVaeMnist(nn.Module):
         test_loss = []
         with torch.no_grad():
             for image_batch, _ in dataloader:
-                image_batch = image_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
                 recon_batch, mu_batch, logvar_batch, latent_batch = self.forward(
                     image_batch
                 )
@@ -924,7 +936,7 @@ class VAE(nn.Module):
         self.train()
         train_loss = []
         for image_batch, _ in tqdm(dataloader, unit="batches", leave=False):
-            image_batch = image_batch.to(device)
+            image_batch = image_batch.to(device, non_blocking=True)
             recon_batch, latent_dist, latent_batch = self.forward(image_batch)
             # Attribution loss in 0 unless attribution 
             # loss function was explicitly defined
@@ -956,7 +968,7 @@ class VAE(nn.Module):
         test_loss = []
         with torch.no_grad():
             for image_batch, _ in dataloader:
-                image_batch = image_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
                 recon_batch, latent_dist, latent_batch = self.forward(image_batch)
                 loss = self.loss_f(
                     image_batch,
@@ -1333,7 +1345,7 @@ class AutoEncoderTinyImageNet(nn.Module):
         self.train()
         train_loss = []
         for image_batch, _ in tqdm(dataloader, unit="batch", leave=False):
-            image_batch = image_batch.to(device)
+            image_batch = image_batch.to(device, non_blocking=True)
             recon_batch = self.forward(image_batch)
             loss = self.loss_f(image_batch, recon_batch)
             optimizer.zero_grad()
@@ -1347,7 +1359,7 @@ class AutoEncoderTinyImageNet(nn.Module):
         test_loss = []
         with torch.no_grad():
             for image_batch, _ in dataloader:
-                image_batch = image_batch.to(device)
+                image_batch = image_batch.to(device, non_blocking=True)
                 pert_batch = self.input_pert(image_batch)
                 recon_batch = self.forward(pert_batch)
                 loss = self.loss_f(image_batch, recon_batch)
@@ -1,4 +1,5 @@
 import abc
+import math
 
 import torch
 from torch.nn import functional as F
@@ -174,6 +175,11 @@ class BtcvaeLoss(BaseVAELoss):
         self.alpha = alpha
         self.gamma = gamma
         self.is_mss = is_mss  # minibatch stratified sampling
+        # Importance-weight matrices keyed by (batch_size, device); they only
+        # depend on the batch size and n_data, so they are built once and
+        # reused across training steps instead of being rebuilt on CPU and
+        # copied to the device every batch
+        self._log_iw_cache = {}
 
     def __call__(
         self, data, recon_batch, latent_dist, is_train, storer, latent_sample=None
@@ -184,8 +190,20 @@ class BtcvaeLoss(BaseVAELoss):
         rec_loss = _reconstruction_loss(
             data, recon_batch, storer=storer, distribution=self.rec_dist
         )
+        log_iw_mat = None
+        if self.is_mss:
+            key = (batch_size, latent_sample.device)
+            if key not in self._log_iw_cache:
+                self._log_iw_cache[key] = log_importance_weight_matrix(
+                    batch_size, self.n_data
+                ).to(latent_sample.device)
+            log_iw_mat = self._log_iw_cache[key]
         log_pz, log_qz, log_prod_qzi, log_q_zCx = _get_log_pz_qz_prodzi_qzCx(
-            latent_sample, latent_dist, self.n_data, is_mss=self.is_mss
+            latent_sample,
+            latent_dist,
+            self.n_data,
+            is_mss=self.is_mss,
+            log_iw_mat=log_iw_mat,
         )
         # I[z;x] = KL[q(z,x)||q(x)q(z)] = E_x[KL[q(z|x)||q(z)]]
         mi_loss = (log_q_zCx - log_qz).mean()
@@ -208,12 +226,29 @@ class BtcvaeLoss(BaseVAELoss):
         )
 
         if storer is not None:
-            storer["loss"].append(loss.item())
-            storer["mi_loss"].append(mi_loss.item())
-            storer["tc_loss"].append(tc_loss.item())
-            storer["dw_kl_loss"].append(dw_kl_loss.item())
-            # computing this for storing and comparaison purposes
-            _ = _kl_normal_loss(*latent_dist, storer)
+            # The non-decomposed KL is recorded for comparison purposes; the
+            # fused kernel runs only on record steps and its values join the
+            # four loss scalars in a single device readback
+            latent_kl = _kl_kernel(*latent_dist)
+            values = (
+                torch.cat(
+                    [
+                        torch.stack([loss, mi_loss, tc_loss, dw_kl_loss]),
+                        latent_kl.sum().reshape(1),
+                        latent_kl,
+                    ]
+                )
+                .detach()
+                .cpu()
+                .tolist()
+            )
+            storer["loss"].append(values[0])
+            storer["mi_loss"].append(values[1])
+            storer["tc_loss"].append(values[2])
+            storer["dw_kl_loss"].append(values[3])
+            storer["kl_loss"].append(values[4])
+            for i in range(latent_dim):
+                storer["kl_loss_" + str(i)].append(values[5 + i])
 
         return loss
 
@@ -251,33 +286,42 @@ def _reconstruction_loss(data, recon_data, distribution="bernoulli", storer=None
         channel)
     """
     batch_size, n_chan, height, width = recon_data.size()
-    n_chan == 3
+    # reduction="mean" folds the normalisation into the reduction kernel;
+    # scaling by the per-image element count recovers exactly sum / batch_size
+    n_pixels = n_chan * height * width
 
     if distribution == "bernoulli":
-        loss = F.binary_cross_entropy(recon_data, data, reduction="sum")
+        loss = F.binary_cross_entropy(recon_data, data, reduction="mean") * n_pixels
     elif distribution == "gaussian":
         # loss in [0,255] space but normalized by 255 to not be too big
-        loss = F.mse_loss(recon_data * 255, data * 255, reduction="sum") / 255
+        loss = F.mse_loss(recon_data * 255, data * 255, reduction="mean") * (
+            n_pixels / 255
+        )
     elif distribution == "laplace":
         # loss in [0,255] space but normalized by 255 to not be too big but
         # multiply by 255 and divide 255, is the same as not doing anything for L1
-        loss = F.l1_loss(recon_data, data, reduction="sum")
+        loss = F.l1_loss(recon_data, data, reduction="mean") * n_pixels
         loss = (
             loss * 3
         )  # emperical value to give similar values than bernoulli => use same hyperparam
-        loss = loss * (loss != 0)  # masking to avoid nan
     else:
         assert distribution not in RECON_DIST
         raise ValueError(f"Unkown distribution: {distribution}")
 
-    loss = loss / batch_size
-
     if storer is not None:
         storer["recon_loss"].append(loss.item())
 
     return loss
 
 
+@torch.jit.script
+def _kl_kernel(mean: torch.Tensor, logvar: torch.Tensor) -> torch.Tensor:
+    """Fused per-dimension KL against a unit normal; scripting lets the JIT
+    fuser stream the (batch, latent_dim) tensors once instead of launching
+    one kernel per elementwise op."""
+    return 0.5 * (-1.0 - logvar + mean * mean + logvar.exp()).mean(dim=0)
+
+
 def _kl_normal_loss(mean, logvar, storer=None):
     """Calculates the KL divergence between a normal distribution
     with diagonal covariance and a unit normal distribution.
@@ -295,13 +339,19 @@ def _kl_normal_loss(mean, logvar, storer=None):
     """
     latent_dim = mean.size(1)
     # batch mean of kl for each latent dimension
-    latent_kl = 0.5 * (-1 - logvar + mean.pow(2) + logvar.exp()).mean(dim=0)
+    latent_kl = _kl_kernel(mean, logvar)
     total_kl = latent_kl.sum()
 
     if storer is not None:
-        storer["kl_loss"].append(total_kl.item())
+        # One readback for the total and the per-dimension values; calling
+        # .item() per dimension would synchronise the device latent_dim + 1
+        # times per recorded step
+        kl_values = (
+            torch.cat([total_kl.reshape(1), latent_kl]).detach().cpu().tolist()
+        )
+        storer["kl_loss"].append(kl_values[0])
         for i in range(latent_dim):
-            storer["kl_loss_" + str(i)].append(latent_kl[i].item())
+            storer["kl_loss_" + str(i)].append(kl_values[i + 1])
 
     return total_kl
 
@@ -322,14 +372,14 @@ def _permute_dims(latent_sample):
         [1] Kim, Hyunjik, and Andriy Mnih. "Disentangling by factorising."
         arXiv preprint arXiv:1802.05983 (2018).
     """
-    perm = torch.zeros_like(latent_sample)
-    batch_size, dim_z = perm.size()
+    batch_size, dim_z = latent_sample.size()
 
-    for z in range(dim_z):
-        pi = torch.randperm(batch_size).to(latent_sample.device)
-        perm[:, z] = latent_sample[pi, z]
-
-    return perm
+    # Sorting one random matrix column-wise yields an independent
+    # permutation per latent dimension in a single kernel, instead of one
+    # randperm + scatter per dimension
+    noise = torch.rand(batch_size, dim_z, device=latent_sample.device)
+    perm_idx = noise.argsort(dim=0)
+    return latent_sample.gather(0, perm_idx)
 
 
 def linear_annealing(init, fin, step, annealing_steps):
@@ -344,27 +394,48 @@ def linear_annealing(init, fin, step, annealing_steps):
 
 # Batch TC specific
 # TO-DO: test if mss is better!
-def _get_log_pz_qz_prodzi_qzCx(latent_sample, latent_dist, n_data, is_mss=True):
+def _get_log_pz_qz_prodzi_qzCx(
+    latent_sample, latent_dist, n_data, is_mss=True, log_iw_mat=None
+):
     batch_size, hidden_dim = latent_sample.shape
 
     # calculate log q(z|x)
     log_q_zCx = log_density_gaussian(latent_sample, *latent_dist).sum(dim=1)
 
     # calculate log p(z)
-    # mean and log var is 0
-    zeros = torch.zeros_like(latent_sample)
-    log_pz = log_density_gaussian(latent_sample, zeros, zeros).sum(1)
+    # mean and log var are 0, so the standard-normal density has a closed
+    # form; this avoids allocating and zero-filling two tensors every step
+    log_pz = -0.5 * (math.log(2 * math.pi) + latent_sample.pow(2)).sum(1)
 
     mat_log_qz = matrix_log_density_gaussian(latent_sample, *latent_dist)
 
     if is_mss:
         # use stratification
-        log_iw_mat = log_importance_weight_matrix(batch_size, n_data).to(
-            latent_sample.device
-        )
+        if log_iw_mat is None:
+            log_iw_mat = log_importance_weight_matrix(batch_size, n_data).to(
+                latent_sample.device
+            )
         mat_log_qz = mat_log_qz + log_iw_mat.view(batch_size, batch_size, 1)
 
-    log_qz = torch.logsumexp(mat_log_qz.sum(2), dim=1, keepdim=False)
-    log_prod_qzi = torch.logsumexp(mat_log_qz, dim=1, keepdim=False).sum(1)
+    # Manual max-shift logsumexp: numerically identical to torch.logsumexp,
+    # but expressed in primitive ops so the compiled path can fuse the
+    # shift/exp/sum/log chain with the trailing sums instead of writing the
+    # (batch, latent_dim) logsumexp intermediate back to memory first
+    joint_log_qz = mat_log_qz.sum(2)
+    max_joint = joint_log_qz.detach().amax(dim=1, keepdim=True)
+    log_qz = (joint_log_qz - max_joint).exp().sum(1).log() + max_joint.squeeze(1)
+    max_dim = mat_log_qz.detach().amax(dim=1, keepdim=True)
+    log_prod_qzi = (
+        (mat_log_qz - max_dim).exp().sum(1).log() + max_dim.squeeze(1)
+    ).sum(1)
 
     return log_pz, log_qz, log_prod_qzi, log_q_zCx
+
+
+if hasattr(torch, "compile") and torch.cuda.is_available():
+    # The (B, B, D) density matrix is streamed from memory three times by
+    # the sum/logsumexp reductions above; Inductor fuses them so the tiles
+    # stay resident. Shapes are constant during training, hence dynamic=False.
+    _get_log_pz_qz_prodzi_qzCx = torch.compile(
+        _get_log_pz_qz_prodzi_qzCx, dynamic=False
+    )
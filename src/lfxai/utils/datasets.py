@@ -317,13 +317,12 @@ class ECG5000(Dataset):
         else:
             raise ValueError("Invalid experiment name.")
 
-        sequences = df.astype(np.float32).to_numpy().tolist()
-        sequences = [
-            torch.tensor(sequence).unsqueeze(1).float() for sequence in sequences
-        ]
+        sequences = torch.from_numpy(
+            np.ascontiguousarray(df.astype(np.float32).to_numpy())
+        ).unsqueeze(-1)
         self.sequences = sequences
-        self.labels = labels
-        self.n_seq, self.seq_len, self.n_features = torch.stack(sequences).shape
+        self.labels = torch.as_tensor(labels, dtype=torch.long)
+        self.n_seq, self.seq_len, self.n_features = sequences.shape
 
     def __len__(self):
         return self.n_seq
@@ -17,6 +17,18 @@ def generate_masks(attr: np.ndarray, mask_size: int, is_normalised: bool = False
 
     """
     dataset_size, n_chanels, H, W = attr.shape
+    if isinstance(attr, torch.Tensor):
+        # Tensor fast path: topk + scatter build every mask in a few
+        # kernels on whatever device the attributions live on
+        attr_sum = attr.abs().sum(dim=1).view(dataset_size, -1)
+        masks = torch.ones_like(attr_sum)
+        top_pixel_values, top_pixels = torch.topk(attr_sum, mask_size)
+        if not is_normalised:
+            masks.scatter_(1, top_pixels, 0.0)
+        else:
+            max_feat = top_pixel_values.amax(dim=1, keepdim=True)
+            masks.scatter_(1, top_pixels, (1 - top_pixel_values) / max_feat)
+        return masks.view(dataset_size, 1, H, W)
     attr = torch.from_numpy(
         np.sum(np.abs(attr), axis=1, keepdims=True)
     )  # Sum the attribution over the channels
@@ -43,6 +55,45 @@ def generate_masks(attr: np.ndarray, mask_size: int, is_normalised: bool = False
     return masks
 
 
+def rank_pixels(attr: torch.Tensor) -> torch.Tensor:
+    """
+    Ranks pixels by attribution magnitude, most important first
+    Args:
+        attr: feature importance scores, shape (dataset_size, channels, H, W)
+
+    Returns:
+        Indices of the flattened pixels sorted by decreasing importance,
+        shape (dataset_size, H * W); masks for any mask size are then
+        prefix selections of these indices
+
+    """
+    dataset_size = attr.shape[0]
+    return (
+        attr.abs().sum(dim=1).view(dataset_size, -1).argsort(dim=-1, descending=True)
+    )
+
+
+def generate_masks_from_ranking(
+    sorted_idx: torch.Tensor, mask_size: int, H: int, W: int
+) -> torch.Tensor:
+    """
+    Generates masks from a precomputed pixel ranking
+    Args:
+        sorted_idx: output of rank_pixels
+        mask_size: number of pixels masked
+        H: image height
+        W: image width
+
+    Returns:
+        Mask hiding the mask_size most important pixels
+
+    """
+    dataset_size = sorted_idx.shape[0]
+    masks = torch.ones(dataset_size, H * W, device=sorted_idx.device)
+    masks.scatter_(1, sorted_idx[:, :mask_size], 0.0)
+    return masks.view(dataset_size, 1, H, W)
+
+
 def generate_tseries_masks(attr: np.ndarray, mask_size: int) -> torch.Tensor:
     """
     Generates mask for time series with feature importance scores